@@ -1,10 +1,26 @@
+import os
+import json
 import time
 import logging
 import argparse
+import multiprocessing
 
-from functools import lru_cache
+from bisect import bisect_right
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+BATCH_SIZE = 1 << 22
+CHUNK_SIZE = 1 << 22
+PROGRESS_SECONDS = 30
+
+# Almanac for pool workers, set once per process by init_worker
+worker_almanac = None
+
 class Almanac:
 
     def __init__(self, raw_data):
@@ -13,7 +29,14 @@ class Almanac:
         self.seeds = []
         self.resources = []
 
+        # Seed -> location as sorted (start, end, shift) pieces
+        self.composed = []
+        self.composed_starts = []
+        # NumPy copies of the composed table, made on first batch lookup
+        self.composed_arrays = None
+
         self.parse_almanac(raw_data)
+        self.compose_maps()
 
 
     def parse_almanac(self, raw_data):
@@ -51,6 +74,254 @@ class Almanac:
             self.maps[map_name].append(mapping)
 
 
+    def map_bound(self):
+        """Lowest key at or past which every map is the identity"""
+
+        bound = 0
+        for mappings in self.maps.values():
+            for mapping in mappings:
+                bound = max(bound, mapping['src'] + mapping['range'], mapping['dest'] + mapping['range'])
+
+        return bound
+
+
+    def invert_maps(self):
+        """Builds the inverse of every map, from location back to seed.
+           Keys that a map leaves alone are added as explicit identity
+           mappings, so a key with no inverse mapping has no preimage.
+           Returns a list of mapping lists, location stage first.
+        """
+
+        bound = self.map_bound()
+        inverted = []
+
+        for i in range(len(self.resources) - 1, 0, -1):
+
+            map_name = '-'.join([self.resources[i-1], 'to', self.resources[i]])
+            mappings = self.maps[map_name]
+
+            inverse = [{'src': m['dest'], 'dest': m['src'], 'range': m['range']} for m in mappings]
+
+            covered = 0
+            for mapping in sorted(mappings, key=lambda m: m['src']):
+                if mapping['src'] > covered:
+                    inverse.append({'src': covered, 'dest': covered, 'range': mapping['src'] - covered})
+                covered = max(covered, mapping['src'] + mapping['range'])
+
+            if covered < bound:
+                inverse.append({'src': covered, 'dest': covered, 'range': bound - covered})
+
+            inverted.append(inverse)
+
+        return inverted
+
+
+    def find_nearest_reverse_location(self):
+        """Part 2 by searching up from location 0 through the inverted maps.
+           Locations are taken one inverse interval at a time, lowest first,
+           and the search stops at the first interval whose preimage touches
+           a seed range. Returns the seed path of the winning seed.
+        """
+
+        inverted = self.invert_maps()
+        bound = self.map_bound()
+
+        seed_ranges = []
+        for ss_idx in range(0, len(self.seeds), 2):
+            seed_start = self.seeds[ss_idx]
+            seed_ranges.append((seed_start, seed_start + self.seeds[ss_idx+1]))
+
+        # Split locations wherever the last inverse map changes
+        cuts = {0, bound}
+        for mapping in inverted[0] if inverted else []:
+            cuts.update((mapping['src'], mapping['src'] + mapping['range']))
+        cuts = sorted(cut for cut in cuts if cut <= bound)
+
+        for lo, hi in zip(cuts, cuts[1:]):
+
+            intervals = [(lo, hi, 0)]
+            for inverse in inverted:
+                intervals = unmap_intervals(inverse, intervals)
+
+            best = None
+            best_loc = None
+            for start, end, offset in intervals:
+                for seed_start, seed_end in seed_ranges:
+                    seed = max(start, seed_start)
+                    if seed < min(end, seed_end) and (best is None or seed + offset < best_loc):
+                        best = seed
+                        best_loc = seed + offset
+
+            if best is not None:
+                logging.debug('REVERSE: found in locations %s -> %s', lo, hi)
+                return self.find_seed_path(seed=best)
+
+        # Every map is the identity from the bound up
+        seed = min((max(seed_start, bound) for seed_start, seed_end in seed_ranges if seed_end > bound), default=None)
+        if seed is None:
+            return None
+
+        return self.find_seed_path(seed=seed)
+
+
+    def compose_maps(self):
+        """Composes every map into one piecewise table from seed to location.
+           Each (start, end, shift) piece maps seeds in [start, end) to
+           seed + shift. Past every map's source and destination ranges all
+           maps are the identity, so the last piece is open ended.
+        """
+
+        bound = self.map_bound()
+
+        intervals = [(0, bound, 0)]
+        for i in range(len(self.resources) - 1):
+            map_name = '-'.join([self.resources[i], 'to', self.resources[i+1]])
+            intervals = map_intervals(self.maps[map_name], intervals)
+
+        pieces = sorted((start + offset, end + offset, -offset) for start, end, offset in intervals)
+        pieces.append((bound, None, 0))
+
+        # Merge neighbours that shift by the same amount
+        self.composed = []
+        for start, end, shift in pieces:
+            if self.composed and self.composed[-1][2] == shift:
+                self.composed[-1] = (self.composed[-1][0], end, shift)
+            else:
+                self.composed.append((start, end, shift))
+
+        self.composed_starts = [start for start, _, _ in self.composed]
+        self.composed_arrays = None
+
+        return self.composed
+
+
+    def location(self, seed):
+
+        if seed < 0:
+            return seed
+
+        return seed + self.composed[bisect_right(self.composed_starts, seed) - 1][2]
+
+
+    def locations(self, seeds):
+        """Maps a NumPy array of seeds to their locations in one searchsorted
+           over the composed table. Memory is a few arrays the size of seeds.
+        """
+
+        if np is None:
+            raise Exception('NumPy is required for batch lookups')
+
+        if self.composed_arrays is None:
+            self.composed_arrays = (
+                    np.array(self.composed_starts, dtype=np.int64),
+                    np.array([shift for _, _, shift in self.composed], dtype=np.int64),
+                    )
+
+        starts, shifts = self.composed_arrays
+        seeds = np.asarray(seeds, dtype=np.int64)
+        idx = np.searchsorted(starts, seeds, side='right') - 1
+
+        return seeds + shifts[idx]
+
+
+    def find_nearest_location_batch(self, batch=BATCH_SIZE):
+        """Brute force part 2 like find_nearest_location(seed_ranges=True),
+           but looking up each batch of seeds as one array
+        """
+
+        # seeds, locations and the searchsorted indexes, 8 bytes each
+        logging.info('BATCH: %s seeds, %s bytes', batch, batch * 8 * 3)
+
+        nearest = None
+        nearest_loc = None
+
+        for ss_idx in range(0, len(self.seeds), 2):
+
+            seed_start = self.seeds[ss_idx]
+            seed_end = seed_start + self.seeds[ss_idx+1]
+
+            logging.info('SEEDS: %s -> %s', seed_start, seed_end)
+
+            for lo in range(seed_start, seed_end, batch):
+
+                seeds = np.arange(lo, min(lo + batch, seed_end), dtype=np.int64)
+                locs = self.locations(seeds)
+                best = int(locs.argmin())
+
+                if nearest is None or locs[best] < nearest_loc:
+                    nearest = int(seeds[best])
+                    nearest_loc = int(locs[best])
+
+        if nearest is None:
+            return None
+
+        return self.find_seed_path(seed=nearest)
+
+
+    def find_nearest_location_parallel(self, jobs, checkpoint=None, chunk_size=CHUNK_SIZE):
+        """Brute force part 2 across a process pool.
+           Seed ranges are cut into chunks, and each finished chunk's nearest
+           seed is saved to the checkpoint file, so a rerun with the same file
+           only sweeps the chunks that are not done yet.
+        """
+
+        chunks = []
+        for ss_idx in range(0, len(self.seeds), 2):
+            seed_start = self.seeds[ss_idx]
+            seed_end = seed_start + self.seeds[ss_idx+1]
+            for lo in range(seed_start, seed_end, chunk_size):
+                chunks.append((lo, min(lo + chunk_size, seed_end)))
+
+        # What the saved chunk results depend on; a checkpoint for anything
+        # else is started over rather than mixed in
+        run = json.loads(json.dumps({
+                'seed_ranges': [self.seeds[i:i+2] for i in range(0, len(self.seeds), 2)],
+                'chunk_size': chunk_size,
+                'maps': self.maps,
+                }))
+
+        done = {}
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint, 'r') as f:
+                saved = json.load(f)
+            if saved.get('run') == run:
+                done = saved['done']
+                logging.info('CHECKPOINT: %s of %s chunks already done', len(done), len(chunks))
+            else:
+                logging.warning('CHECKPOINT: %s is for different seeds, maps or chunk size, starting over', checkpoint)
+
+        todo = [chunk for chunk in chunks if f'{chunk[0]}-{chunk[1]}' not in done]
+        total = sum(end - start for start, end in todo)
+        swept = 0
+        start_time = time.time()
+        last_report = start_time
+
+        with multiprocessing.Pool(jobs, initializer=init_worker, initargs=(self,)) as pool:
+
+            for (lo, hi), seed in pool.imap_unordered(sweep_chunk, todo):
+
+                done[f'{lo}-{hi}'] = seed
+                swept += hi - lo
+
+                if checkpoint:
+                    with open(checkpoint + '.tmp', 'w') as f:
+                        json.dump({'run': run, 'done': done}, f)
+                    os.replace(checkpoint + '.tmp', checkpoint)
+
+                now = time.time()
+                if now - last_report >= PROGRESS_SECONDS or swept == total:
+                    rate = swept / max(now - start_time, 1e-9)
+                    logging.info('PROGRESS: %s/%s seeds, %s seeds/s, ETA %s seconds', swept, total, round(rate), round((total - swept) / rate))
+                    last_report = now
+
+        seeds = [done[f'{lo}-{hi}'] for lo, hi in chunks]
+        seeds = [seed for seed in seeds if seed is not None]
+        if not seeds:
+            return None
+
+        return self.find_seed_path(seed=min(seeds, key=self.chain_location))
+
+
     def find_seed_path(self, seed):
 
         seed_path = {}
@@ -68,7 +339,20 @@ class Almanac:
         return seed_path
 
 
-    @lru_cache
+    def chain_location(self, seed):
+        """Location of a seed found by walking each map in turn, like
+           find_seed_path, so brute force results do not share code with
+           the composed table or the interval engine
+        """
+
+        key = seed
+        for i in range(len(self.resources) - 1):
+            map_name = '-'.join([self.resources[i], 'to', self.resources[i+1]])
+            key = self.map_lookup(map_name, key)
+
+        return key
+
+
     def map_lookup(self, map_name, key):
         ##
         # seed-to-soil map:
@@ -77,7 +361,7 @@ class Almanac:
 
         val = None
         for mapping in self.maps[map_name]:
-            if key >= mapping['src'] and key <= mapping['src'] + mapping['range']:
+            if key >= mapping['src'] and key < mapping['src'] + mapping['range']:
                 val = (key - mapping['src']) + mapping['dest']
                 break
 
@@ -87,17 +371,48 @@ class Almanac:
         return val
 
 
+    def location_intervals(self):
+        """Maps every seed range, as whole intervals, to location intervals.
+           Returns (start, end, offset) with end exclusive, where the seed
+           for a location in the interval is location + offset.
+        """
+
+        intervals = []
+        for ss_idx in range(0, len(self.seeds), 2):
+            seed_start = self.seeds[ss_idx]
+            intervals.append((seed_start, seed_start + self.seeds[ss_idx+1], 0))
+
+        for i in range(len(self.resources) - 1):
+
+            map_name = '-'.join([self.resources[i], 'to', self.resources[i+1]])
+            intervals = map_intervals(self.maps[map_name], intervals)
+
+            logging.debug('%s: %s intervals', map_name, len(intervals))
+
+        return intervals
+
+
+    def find_nearest_range_location(self):
+        """Part 2 without visiting seeds one by one. Returns the seed path of
+           the seed with the lowest location, like find_nearest_location
+        """
+
+        nearest = min(self.location_intervals(), default=None)
+        if nearest is None:
+            return None
+
+        start, _, offset = nearest
+
+        return self.find_seed_path(seed=start + offset)
+
+
     def find_nearest_location(self, seed_ranges=False):
 
         nearest = None
 
         if not seed_ranges:
 
-            for seed in self.seeds:
-
-                seed_path = self.find_seed_path(seed=seed)
-                if nearest is None or seed_path['location'] < nearest['location']:
-                    nearest = seed_path
+            nearest = min(self.seeds, key=self.location, default=None)
 
         else:
 
@@ -108,13 +423,91 @@ class Almanac:
 
                 logging.info('SEEDS: %s -> %s', seed_start, seed_end)
 
-                for seed in range(seed_start, seed_end + 1):
+                seed = min(range(seed_start, seed_end), key=self.chain_location, default=None)
+                if seed is not None and (nearest is None or self.chain_location(seed) < self.chain_location(nearest)):
+                    nearest = seed
+
+        if nearest is None:
+            return None
+
+        return self.find_seed_path(seed=nearest)
+
+
+def init_worker(almanac):
+
+    global worker_almanac
+    worker_almanac = almanac
+
+
+def sweep_chunk(chunk):
+    """Nearest seed in one [start, end) chunk, using the worker's Almanac"""
+
+    lo, hi = chunk
+
+    return chunk, min(range(lo, hi), key=worker_almanac.chain_location, default=None)
+
+
+def unmap_intervals(inverse, intervals):
+    """Pushes (start, end, offset) intervals through one inverted map, like
+       map_intervals. A key may match several inverse mappings, and a key
+       matching none has no preimage and is dropped.
+    """
+
+    mapped = []
+
+    for start, end, offset in intervals:
+
+        for mapping in inverse:
+
+            src = mapping['src']
+            shift = mapping['dest'] - src
 
-                    seed_path = self.find_seed_path(seed=seed)
-                    if nearest is None or seed_path['location'] < nearest['location']:
-                        nearest = seed_path
+            lo = max(start, src)
+            hi = min(end, src + mapping['range'])
 
-        return nearest
+            if lo < hi:
+                mapped.append((lo + shift, hi + shift, offset - shift))
+
+    return mapped
+
+
+def map_intervals(mappings, intervals):
+    """Pushes (start, end, offset) intervals through one map.
+       Intervals are split at mapping boundaries, and offset is adjusted so
+       start + offset is still the seed the interval started from.
+    """
+
+    mapped = []
+    pending = list(intervals)
+
+    for mapping in mappings:
+
+        src = mapping['src']
+        src_end = src + mapping['range']
+        shift = mapping['dest'] - src
+
+        unmapped = []
+
+        for start, end, offset in pending:
+
+            lo = max(start, src)
+            hi = min(end, src_end)
+
+            if lo >= hi:
+                unmapped.append((start, end, offset))
+                continue
+
+            mapped.append((lo + shift, hi + shift, offset - shift))
+
+            if start < lo:
+                unmapped.append((start, lo, offset))
+            if hi < end:
+                unmapped.append((hi, end, offset))
+
+        pending = unmapped
+
+    # Anything left over maps to itself
+    return mapped + pending
 
 
 def parse_args():
@@ -125,6 +518,11 @@ def parse_args():
     parser.add_argument('-p1', '--part-1', dest='p1', action='store_true', default=False, help='Only run part 1')
     parser.add_argument('-p2', '--part-2', dest='p2', action='store_true', default=False, help='Only run part 2, overrides -p1')
     parser.add_argument('-l', '--log', dest='logfile', action='store', help='Filename for writing log file')
+    parser.add_argument('-n', '--numpy', dest='numpy', action='store_true', default=False, help='Look up brute force seeds in NumPy batches')
+    parser.add_argument('-j', '--jobs', dest='jobs', action='store', type=int, default=1, help='Number of worker processes for the brute force')
+    parser.add_argument('-c', '--checkpoint', dest='checkpoint', action='store', help='Checkpoint file for resuming brute force with --jobs')
+    parser.add_argument('-r', '--reverse', dest='reverse', action='store_true', default=False, help='Search part 2 upwards from location 0')
+    parser.add_argument('-b', '--brute-force', dest='brute', action='store_true', default=False, help='Check every seed in part 2 instead of whole ranges')
 
     parsed = parser.parse_args()
 
@@ -160,7 +558,17 @@ if __name__ == '__main__':
     # Part 2
     if not conf.p1 or conf.p2:
         start = time.time()
-        min_location = almanac.find_nearest_location(seed_ranges=True)
+        if conf.brute and conf.jobs > 1:
+            checkpoint = conf.checkpoint or datafile + '.checkpoint'
+            min_location = almanac.find_nearest_location_parallel(conf.jobs, checkpoint=checkpoint)
+        elif conf.brute and conf.numpy:
+            min_location = almanac.find_nearest_location_batch()
+        elif conf.brute:
+            min_location = almanac.find_nearest_location(seed_ranges=True)
+        elif conf.reverse:
+            min_location = almanac.find_nearest_reverse_location()
+        else:
+            min_location = almanac.find_nearest_range_location()
         end = time.time()
         logging.info('[Part 2] Solution: %s in %s seconds', min_location, round(end - start, 4))
 
@@ -2,99 +2,185 @@ import time
 import logging
 import argparse
 
+from collections import deque
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+BATCH_SIZE = 1 << 16
+
+
+def number_mask(nums_raw):
+    """Packs space separated numbers into an int with bit n set for each n"""
+
+    mask = 0
+    for num in nums_raw.split():
+        mask |= 1 << int(num)
+
+    return mask
+
+
+def parse_card(line):
+    """Parses one card line into (winning numbers, my numbers mask)"""
+
+    parts = line.split(': ')
+    nums_raw = parts[1].split(' | ')
+
+    return (tuple(int(num) for num in nums_raw[0].split()), number_mask(nums_raw[1]))
+
+
+def count_matches(card):
+    """Counts the winning numbers that are among my numbers. A winning
+       number listed twice counts twice, as in the vectorized engine.
+    """
+
+    win, mine = card
+
+    return sum(mine >> num & 1 for num in win)
+
+
+def stream_cards(lines):
+    """Yields running (points, cards) totals for each card as it is read.
+       Only the pending copy counts for the next few cards are kept, so the
+       buffer is never longer than the largest match count seen.
+    """
+
+    pending = deque()
+    points = 0
+    cards = 0
+
+    for line in lines:
+
+        if not line.strip():
+            continue
+
+        winners = count_matches(parse_card(line))
+
+        copies = 1 + (pending.popleft() if pending else 0)
+
+        for offset in range(winners):
+            if offset < len(pending):
+                pending[offset] += copies
+            else:
+                pending.append(copies)
+
+        if winners:
+            points += 1 << (winners - 1)
+        cards += copies
+
+        yield points, cards
+
 
 class ScratchOffs:
 
-    def __init__(self, cards_raw):
+    def __init__(self, cards_raw, vector=False):
 
+        # (winning numbers, my numbers mask) per card, or with vector, a
+        # (winning, my numbers) pair of cards x numbers arrays
         self.cards = None
+        # Matching numbers per card
+        self.wins = None
+        self.vector = vector
 
-        self.parse_cards(cards_raw)
+        if vector:
+            self.parse_cards_vector(cards_raw)
+        else:
+            self.parse_cards(cards_raw)
 
 
     def parse_cards(self, raw_data):
 
         self.cards = []
+        self.wins = []
 
         lines = raw_data.split('\n')
 
         for line in lines:
 
-            parts = line.split(': ')
+            card = parse_card(line)
 
-            card_id = int(parts[0].split()[1])
-            nums_raw = parts[1].split(' | ')
+            self.cards.append(card)
+            self.wins.append(count_matches(card))
 
-            winning = nums_raw[0].split()
-            mynums = nums_raw[1].split()
 
-            self.cards.append({
-                    'win': winning,
-                    'my': mynums,
-                    })
+    def parse_cards_vector(self, raw_data, batch=BATCH_SIZE):
+        """Loads cards into 2-D int arrays and counts every card's matches
+           with one broadcast comparison per batch of cards.
+           Every card must have as many winning and my numbers as the first.
+        """
 
+        if np is None:
+            raise Exception('NumPy is required for the vectorized engine')
 
-    def sum_points(self):
-
-        total = 0
+        lines = raw_data.split('\n')
+        first = lines[0].split(': ')[1].split(' | ')
+        nwin = len(first[0].split())
+        nmine = len(first[1].split())
 
-        for cid, card in enumerate(self.cards):
+        win = np.empty((len(lines), nwin), dtype=np.int64)
+        mine = np.empty((len(lines), nmine), dtype=np.int64)
 
-            points = 0
+        for card_id, line in enumerate(lines):
 
-            for win in card['win']:
+            win_raw, mine_raw = line.split(': ')[1].split(' | ')
+            win_row = np.fromstring(win_raw, dtype=np.int64, sep=' ')
+            mine_row = np.fromstring(mine_raw, dtype=np.int64, sep=' ')
 
-                if win in card['my']:
-                    if points == 0:
-                        points = 1
-                    else:
-                        points = points * 2
+            if len(win_row) != nwin or len(mine_row) != nmine:
+                raise Exception(f'Card has {len(win_row)} | {len(mine_row)} numbers, expected {nwin} | {nmine}: {line}')
 
-            total += points
+            win[card_id] = win_row
+            mine[card_id] = mine_row
 
-        return total
+        self.cards = (win, mine)
+        self.wins = np.empty(len(lines), dtype=np.int64)
 
+        for lo in range(0, len(lines), batch):
+            hits = win[lo:lo+batch, :, None] == mine[lo:lo+batch, None, :]
+            self.wins[lo:lo+batch] = hits.any(axis=2).sum(axis=1)
 
-    def count_wins(self, card_id):
 
-        winners = 0
-        for win in self.cards[card_id]['win']:
-            if win in self.cards[card_id]['my']:
-                winners += 1
-
-        return winners
+    def sum_points(self):
 
+        if self.vector:
+            points = np.left_shift(1, self.wins - 1, where=self.wins > 0, out=np.zeros_like(self.wins))
+            return int(points.sum())
 
-    def total_cards(self, card_id):
+        total = 0
 
-        logging.debug('CARD_ID: %s', card_id)
+        for winners in self.wins:
+            if winners:
+                total += 1 << (winners - 1)
 
-        winners = self.count_wins(card_id)
-        #logging.debug('WINNERS: %s', winners)
+        return total
 
-        if not winners:
-            return 0
 
-        subwins = 0
-        for offset in range(1, winners+1):
-            #logging.debug('%s -> SUB: %s', card_id, card_id+offset)
-            subwins += self.total_cards(card_id+offset)
+    def count_wins(self, card_id):
 
-        return winners + subwins
+        return self.wins[card_id]
 
 
     def all_card_totals(self):
+        """Counts every original and copied card in one forward pass.
+           Each card's copy count is final once reached, since only earlier
+           cards can win copies of it.
+        """
 
-        total = len(self.cards)
+        wins = self.wins.tolist() if self.vector else self.wins
+        copies = [1] * len(wins)
 
-        for i in range(len(self.cards)):
+        for card_id, winners in enumerate(wins):
 
-            tcards = self.total_cards(i)
-            total += self.total_cards(i)
+            logging.debug('CARD_ID: %s x %s WINS: %s', card_id, copies[card_id], winners)
 
-        return total
+            for won_id in range(card_id + 1, min(card_id + winners + 1, len(wins))):
+                copies[won_id] += copies[card_id]
+
+        return sum(copies)
 
 
 def parse_args():
@@ -105,6 +191,8 @@ def parse_args():
     parser.add_argument('-p1', '--part-1', dest='p1', action='store_true', default=False, help='Only run part 1')
     parser.add_argument('-p2', '--part-2', dest='p2', action='store_true', default=False, help='Only run part 2, overrides -p1')
     parser.add_argument('-l', '--log', dest='logfile', action='store', help='Filename for writing log file')
+    parser.add_argument('-n', '--numpy', dest='numpy', action='store_true', default=False, help='Match cards with the NumPy engine')
+    parser.add_argument('-s', '--stream', dest='stream', action='store_true', default=False, help='Stream cards, keeping only pending copy counts')
 
     parsed = parser.parse_args()
 
@@ -123,14 +211,27 @@ if __name__ == '__main__':
         fn.insert(1, 'test')
     datafile = '.'.join(fn)
 
-    with open(datafile, 'r') as f:
-        data_in = f.read().strip()
+    ##
+    # Both parts, one card at a time
+    if conf.stream:
+        start = time.time()
+        card_points, total_cards = 0, 0
+        with open(datafile, 'r') as f:
+            for card_points, total_cards in stream_cards(f):
+                pass
+        end = time.time()
+        logging.info('[Part 1] Solution: %s in %s seconds', card_points, round(end - start, 4))
+        logging.info('[Part 2] Solution: %s in %s seconds', total_cards, round(end - start, 4))
+
+    else:
+        with open(datafile, 'r') as f:
+            data_in = f.read().strip()
 
-    scratchers = ScratchOffs(data_in)
+        scratchers = ScratchOffs(data_in, vector=conf.numpy)
 
     ##
     # Part 1
-    if not conf.p2:
+    if not conf.p2 and not conf.stream:
         start = time.time()
         card_points = scratchers.sum_points()
         end = time.time()
@@ -138,7 +239,7 @@ if __name__ == '__main__':
 
     ##
     # Part 2
-    if not conf.p1 or conf.p2:
+    if (not conf.p1 or conf.p2) and not conf.stream:
         start = time.time()
         total_cards = scratchers.all_card_totals()
         end = time.time()
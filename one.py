@@ -1,102 +1,171 @@
+import os
 import time
 import logging
 import argparse
+import multiprocessing
 
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-def find_num(line, alpha=False, rev=False):
 
-    logging.debug('ARGS: %s / %s / %s', line, alpha, rev)
+SWAP_MAP = {
+        'one': 1,
+        'two': 2,
+        'three': 3,
+        'four': 4,
+        'five': 5,
+        'six': 6,
+        'seven': 7,
+        'eight': 8,
+        'nine': 9,
+        'zero': 0
+        }
 
-    swap_map = {
-            'one': 1,
-            'two': 2,
-            'three': 3,
-            'four': 4,
-            'five': 5,
-            'six': 6,
-            'seven': 7,
-            'eight': 8,
-            'nine': 9,
-            'zero': 0
-            }
-
-    idx = 0
-    numval = None
-    numidx = None
-
-    for idx in range(len(line)):
-
-        try:
-            int(line[idx])
-        except ValueError:
-            idx += 1
-        else:
-            if numidx is None or (rev and idx > numidx) or (not rev and idx < numidx):
-                numval = int(line[idx])
-                numidx = idx
 
-    #print(f'FOUND: {numval} @ {numidx}')
+def build_matcher(words):
+    """Compiles words into an Aho-Corasick automaton.
+       Failure links are folded into the transition tables, so scanning is
+       one dict lookup per character. Returns (transitions, outputs), where
+       outputs[state] is (value, length) for the word ending at that state.
+    """
+
+    goto = [{}]
+    outputs = [None]
+
+    for word, val in words.items():
+        state = 0
+        for char in word:
+            if char not in goto[state]:
+                goto.append({})
+                outputs.append(None)
+                goto[state][char] = len(goto) - 1
+            state = goto[state][char]
+        outputs[state] = (val, len(word))
+
+    # Breadth first, so every fail target is complete before it is copied
+    fail = [0] * len(goto)
+    trans = [dict(goto[0])]
+    trans.extend({} for _ in range(len(goto) - 1))
+    queue = list(goto[0].values())
+
+    while queue:
 
-    alphval = None
-    alphidx = None
+        state = queue.pop(0)
+        trans[state] = dict(trans[fail[state]])
 
-    if alpha:
+        if outputs[state] is None:
+            outputs[state] = outputs[fail[state]]
 
-        for alpha in swap_map:
+        for char, nxt in goto[state].items():
+            fail[nxt] = trans[fail[state]].get(char, 0)
+            trans[state][char] = nxt
+            queue.append(nxt)
 
-            # If rev, find last one, else first one
-            if rev:
-                for i in range(len(line), 0, -1):
-                    found = line.find(alpha, i)
-                    if found > -1:
-                        break
-            else:
-                found = line.find(alpha)
+    return trans, outputs
 
-            logging.debug('FOUND: %s @ %s', swap_map[alpha], found)
 
-            if found > -1:
+MATCHER = build_matcher(SWAP_MAP)
 
-                if alphidx is None:
-                    alphidx = found
-                    alphval = swap_map[alpha]
-                    continue
+CHUNK_SIZE = 1 << 20
 
-                if rev:
-                    if found > alphidx:
-                        alphval = swap_map[alpha]
-                        alphidx = found
-                else:
-                    if found < alphidx:
-                        alphval = swap_map[alpha]
-                        alphidx = found
 
-    logging.debug('NUM: %s @ %s', numval, numidx)
-    logging.debug('ALPH: %s @ %s', alphval, alphidx)
+def scan_line(line, alpha=False):
+    """Finds the first and last number in a line in a single pass.
+       Overlapping words count separately, so 'eightwo' is 8 then 2.
+       Returns (first, last), either of which is None if nothing matched.
+    """
 
-    if alphidx is not None:
+    trans, outputs = MATCHER
 
-        if numidx is None:
-            return alphval
+    first = None
+    last = None
+    firstidx = None
+    lastidx = None
+    state = 0
 
-        if rev:
-            if alphidx > numidx:
-                return alphval
-            if numidx > alphidx:
-                return numval
+    for idx, char in enumerate(line):
+
+        if '0' <= char <= '9':
+            val = ord(char) - 48
+            start = idx
+            state = 0
+        elif not alpha:
+            continue
+        else:
+            state = trans[state].get(char, 0)
+            if outputs[state] is None:
+                continue
+            val, length = outputs[state]
+            start = idx - length + 1
+
+        if firstidx is None or start < firstidx:
+            first = val
+            firstidx = start
+
+        if lastidx is None or start > lastidx:
+            last = val
+            lastidx = start
+
+    return first, last
+
+
+def scan_line_fused(line):
+    """Like scan_line, but tracks digits alone and digits with words at once.
+       Returns (first, last, alpha_first, alpha_last).
+    """
+
+    trans, outputs = MATCHER
+
+    first = None
+    last = None
+    alphfirst = None
+    alphlast = None
+    alphfirstidx = None
+    alphlastidx = None
+    state = 0
+
+    for idx, char in enumerate(line):
+
+        if '0' <= char <= '9':
+            val = ord(char) - 48
+            start = idx
+            state = 0
+            if first is None:
+                first = val
+            last = val
         else:
-            if alphidx < numidx:
-                return alphval
-            if numidx < alphidx:
-                return numval
+            state = trans[state].get(char, 0)
+            if outputs[state] is None:
+                continue
+            val, length = outputs[state]
+            start = idx - length + 1
+
+        if alphfirstidx is None or start < alphfirstidx:
+            alphfirst = val
+            alphfirstidx = start
+
+        if alphlastidx is None or start > alphlastidx:
+            alphlast = val
+            alphlastidx = start
+
+    return first, last, alphfirst, alphlast
 
-    if numidx is not None:
 
-        return numval
+def find_num(line, alpha=False, rev=False):
+
+    logging.debug('ARGS: %s / %s / %s', line, alpha, rev)
+
+    first, last = scan_line(line, alpha=alpha)
+    numval = last if rev else first
 
-    raise Exception(f'No number found: {line}')
+    if numval is None:
+        raise Exception(f'No number found: {line}')
+
+    return numval
 
 
 def lines_total(lines, alpha=False):
@@ -110,8 +179,9 @@ def lines_total(lines, alpha=False):
 
         logging.debug('LINE: %s', line)
 
-        first = find_num(line, alpha=alpha)
-        last = find_num(line, alpha=alpha, rev=True)
+        first, last = scan_line(line, alpha=alpha)
+        if first is None:
+            raise Exception(f'No number found: {line}')
 
         num = int(f'{first}{last}')
         logging.debug('ANS: %s', num)
@@ -121,6 +191,197 @@ def lines_total(lines, alpha=False):
     return sum_total
 
 
+def lines_totals(lines):
+    """Sums both parts in a single sweep over the lines.
+       Returns (numeric_total, alpha_total)
+    """
+
+    num_total = 0
+    alph_total = 0
+
+    for line in lines:
+
+        if not line:
+            continue
+
+        logging.debug('LINE: %s', line)
+
+        first, last, alphfirst, alphlast = scan_line_fused(line)
+        if first is None or alphfirst is None:
+            raise Exception(f'No number found: {line}')
+
+        logging.debug('ANS: %s / %s', first * 10 + last, alphfirst * 10 + alphlast)
+        num_total += first * 10 + last
+        alph_total += alphfirst * 10 + alphlast
+
+    return num_total, alph_total
+
+
+def stream_lines(fh, chunk_size=CHUNK_SIZE):
+    """Yields lines from a file handle, reading fixed-size chunks.
+       A partial line at the end of a chunk is carried into the next one,
+       so memory stays at one chunk plus the longest line.
+    """
+
+    tail = ''
+
+    while True:
+
+        chunk = fh.read(chunk_size)
+        if not chunk:
+            break
+
+        lines = (tail + chunk).split('\n')
+        tail = lines.pop()
+
+        yield from lines
+
+    if tail:
+        yield tail
+
+
+def stream_file(datafile, chunk_size=CHUNK_SIZE):
+
+    with open(datafile, 'r') as f:
+        yield from stream_lines(f, chunk_size=chunk_size)
+
+
+def stream_range(datafile, start, end, chunk_size=CHUNK_SIZE):
+    """Yields the lines in a byte range of a file, reading in chunks.
+       The range must begin at the start of a line and end after a newline
+       or at the end of the file.
+    """
+
+    with open(datafile, 'rb') as f:
+
+        f.seek(start)
+        remaining = end - start
+        tail = b''
+
+        while remaining > 0:
+
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+
+            lines = (tail + chunk).split(b'\n')
+            tail = lines.pop()
+
+            for line in lines:
+                yield line.decode()
+
+        if tail:
+            yield tail.decode()
+
+
+def shard_ranges(datafile, jobs):
+    """Splits a file into at most `jobs` byte ranges aligned to newlines"""
+
+    size = os.path.getsize(datafile)
+    bounds = [0]
+
+    with open(datafile, 'rb') as f:
+
+        for i in range(1, jobs):
+
+            f.seek(max(size * i // jobs, bounds[-1]))
+            f.readline()
+            bounds.append(f.tell())
+
+    bounds.append(size)
+
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def shard_total(job):
+
+    datafile, start, end, alpha, fused = job
+
+    lines = stream_range(datafile, start, end)
+
+    if fused:
+        return lines_totals(lines)
+
+    return lines_total(lines, alpha=alpha)
+
+
+def sharded_total(datafile, jobs, alpha=False, fused=False):
+    """Sums the file across a process pool, one newline-aligned shard per job.
+       Returns the same as lines_totals when fused, otherwise lines_total
+    """
+
+    shards = [(datafile, start, end, alpha, fused) for start, end in shard_ranges(datafile, jobs)]
+    logging.debug('SHARDS: %s', shards)
+
+    with multiprocessing.Pool(jobs) as pool:
+        partials = pool.map(shard_total, shards)
+
+    if fused:
+        return tuple(sum(part) for part in zip(*partials)) or (0, 0)
+
+    return sum(partials)
+
+
+def vector_total(buf):
+    """Part 1 sum over a uint8 buffer of whole newline-terminated lines.
+       Digits are masked in one pass and each line's first and last digit
+       come from a searchsorted of the line bounds into the digit offsets.
+    """
+
+    digits = np.flatnonzero((buf >= 48) & (buf <= 57))
+    ends = np.flatnonzero(buf == 10)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    # Skip blank lines, as lines_total does
+    filled = ends > starts
+    starts = starts[filled]
+    ends = ends[filled]
+
+    first = np.searchsorted(digits, starts)
+    last = np.searchsorted(digits, ends) - 1
+
+    missing = first > last
+    if missing.any():
+        line = bytes(buf[starts[missing][0]:ends[missing][0]]).decode()
+        raise Exception(f'No number found: {line}')
+
+    tens = buf[digits[first]].astype(np.int64) - 48
+    ones = buf[digits[last]].astype(np.int64) - 48
+
+    return int((tens * 10 + ones).sum())
+
+
+def vector_file_total(datafile, chunk_size=CHUNK_SIZE):
+    """Part 1 sum of a file using vector_total, one chunk of lines at a time"""
+
+    if np is None:
+        raise Exception('NumPy is required for the vectorized engine')
+
+    sum_total = 0
+    tail = b''
+
+    with open(datafile, 'rb') as f:
+
+        while True:
+
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+
+            block = tail + chunk
+            cut = block.rfind(b'\n') + 1
+            tail = block[cut:]
+
+            if cut:
+                sum_total += vector_total(np.frombuffer(block, dtype=np.uint8, count=cut))
+
+    if tail:
+        sum_total += vector_total(np.frombuffer(tail + b'\n', dtype=np.uint8))
+
+    return sum_total
+
+
 def parse_args():
 
     parser = argparse.ArgumentParser(description='2023 Advent of Code, Day 1', epilog='https://adventofcode.com')
@@ -129,9 +390,19 @@ def parse_args():
     parser.add_argument('-p1', '--part-1', dest='p1', action='store_true', default=False, help='Only run part 1')
     parser.add_argument('-p2', '--part-2', dest='p2', action='store_true', default=False, help='Only run part 2, overrides -p1')
     parser.add_argument('-l', '--log', dest='logfile', action='store', help='Filename for writing log file')
+    parser.add_argument('-f', '--fused', dest='fused', action='store_true', default=False, help='Solve both parts in a single pass')
+    parser.add_argument('-s', '--stream', dest='stream', action='store_true', default=False, help='Read input in chunks instead of all at once')
+    parser.add_argument('-n', '--numpy', dest='numpy', action='store_true', default=False, help='Use the NumPy engine for part 1')
+    parser.add_argument('-j', '--jobs', dest='jobs', action='store', type=int, default=1, help='Number of worker processes, each summing a slice of the input')
 
     parsed = parser.parse_args()
 
+    # The NumPy engine is single process and only covers part 1
+    if parsed.numpy and parsed.fused:
+        parser.error('--numpy cannot be combined with --fused')
+    if parsed.numpy and parsed.jobs > 1:
+        parser.error('--numpy cannot be combined with --jobs')
+
     return parsed
 
 
@@ -147,24 +418,47 @@ if __name__ == '__main__':
         fn.insert(1, 'test')
     datafile = '.'.join(fn)
 
-    with open(datafile, 'r') as f:
-        data_in = f.read().strip()
+    if conf.stream or conf.jobs > 1 or conf.numpy:
+        lines = None
+    else:
+        with open(datafile, 'r') as f:
+            data_in = f.read().strip()
+
+        lines = data_in.split('\n')
 
-    lines = data_in.split('\n')
+    ##
+    # Both parts, one pass
+    if conf.fused:
+        start = time.time()
+        if conf.jobs > 1:
+            num_total, alph_total = sharded_total(datafile, conf.jobs, fused=True)
+        else:
+            num_total, alph_total = lines_totals(lines if lines is not None else stream_file(datafile))
+        end = time.time()
+        logging.info('[Part 1] Solution: %s in %s seconds', num_total, round(end - start, 4))
+        logging.info('[Part 2] Solution: %s in %s seconds', alph_total, round(end - start, 4))
 
     ##
     # Part 1
-    if not conf.p2:
+    if not conf.p2 and not conf.fused:
         start = time.time()
-        sum_total = lines_total(lines)
+        if conf.numpy:
+            sum_total = vector_file_total(datafile)
+        elif conf.jobs > 1:
+            sum_total = sharded_total(datafile, conf.jobs)
+        else:
+            sum_total = lines_total(lines if lines is not None else stream_file(datafile))
         end = time.time()
         logging.info('[Part 1] Solution: %s in %s seconds', sum_total, round(end - start, 4))
 
     ###
     ## Part 2
-    if not conf.p1 or conf.p2:
+    if (not conf.p1 or conf.p2) and not conf.fused:
         start = time.time()
-        sum_total = lines_total(lines, alpha=True)
+        if conf.jobs > 1:
+            sum_total = sharded_total(datafile, conf.jobs, alpha=True)
+        else:
+            sum_total = lines_total(lines if lines is not None else stream_file(datafile), alpha=True)
         end = time.time()
         logging.info('[Part 2] Solution: %s in %s seconds', sum_total, round(end - start, 4))
 
@@ -1,9 +1,19 @@
+import math
 import time
 import logging
 import argparse
 
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Race times up to this keep every square in calculate_races inside int64
+MAX_VECTOR_TIME = 2 ** 31
+
 
 def parse_races(raw_data):
 
@@ -23,17 +33,81 @@ def parse_races(raw_data):
 
 
 def calculate_race(race_time, distance):
+    """Counts the hold times in 1..race_time-1 that beat the distance.
+       hold * (race_time - hold) > distance holds strictly between the roots
+       of the quadratic, so the first winning hold comes from an integer
+       square root, nudged to the exact boundary, and the rest follow by
+       symmetry. Exact for integers of any size.
+    """
+
+    disc = race_time * race_time - 4 * distance
+    if disc <= 0:
+        return 0
+
+    hold = (race_time - math.isqrt(disc)) // 2
+
+    # Roots can fall with no whole hold time between them
+    while hold * (race_time - hold) <= distance:
+        if hold > race_time // 2:
+            return 0
+        hold += 1
+    while hold > 1 and (hold - 1) * (race_time - hold + 1) > distance:
+        hold -= 1
+
+    hold = max(hold, 1)
+    last = race_time - hold
+
+    return max(last - hold + 1, 0)
+
+
+def calculate_races(times, distances):
+    """Win-way counts for parallel arrays of race times and distances.
 
-    win_ways = 0
+       A hold h wins when |2h - T| < sqrt(T^2 - 4D), so the count is one more
+       than the largest such |2h - T| with the parity of T, capped at T - 2
+       to keep h in 1..T-1. That vectorizes as long as T^2 fits in int64;
+       bigger races fall back to calculate_race on Python ints.
+    """
 
-    for hold_ms in range(1, race_time):
+    if np is None:
+        return [calculate_race(race_time, dist) for race_time, dist in zip(times, distances)]
 
-        race_dist = (race_time - hold_ms) * hold_ms
+    try:
+        race_times = np.asarray(times, dtype=np.int64)
+        dists = np.asarray(distances, dtype=np.int64)
+    except OverflowError:
+        race_times = None
 
-        if race_dist > distance:
-            win_ways += 1
+    if (race_times is None or race_times.max(initial=0) > MAX_VECTOR_TIME
+            or dists.min(initial=0) < 0 or dists.max(initial=0) > MAX_VECTOR_TIME ** 2 // 4):
+        return np.array([calculate_race(int(race_time), int(dist)) for race_time, dist in zip(times, distances)], dtype=object)
 
-    return win_ways
+    disc = race_times * race_times - 4 * dists
+
+    # Exact isqrt: float sqrt is within one of it at this size
+    root = np.sqrt(np.maximum(disc, 0).astype(np.float64)).astype(np.int64)
+    root -= root * root > disc
+    root += (root + 1) * (root + 1) <= disc
+
+    # Largest k with k * k < disc, then matched to the parity of T
+    kmax = np.where(root * root < disc, root, root - 1)
+    kmax = np.minimum(kmax, race_times - 1)
+    kmax -= (kmax - race_times) % 2
+
+    return np.maximum(kmax + 1, 0)
+
+
+def stream_race_product(batches):
+    """Multiplies the win-way counts of every race across batches of
+       (times, distances), without keeping more than one batch of counts
+    """
+
+    mult_total = 1
+
+    for times, distances in batches:
+        mult_total *= math.prod(int(ways) for ways in calculate_races(times, distances))
+
+    return mult_total
 
 
 def sim_races(race_data):
@@ -1,37 +1,84 @@
+import re
 import time
 import logging
 import argparse
+import multiprocessing
 
 from pathlib import Path
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+NEIGHBORS = (
+        (-1, -1), (-1, 0), (-1, 1),
+        ( 0, -1),          ( 0, 1),
+        ( 1, -1), ( 1, 0), ( 1, 1),
+        )
+
+NUMBER_RE = re.compile(r'\d+')
+
 
 class Schematic:
 
     def __init__(self, schematic):
 
-        self.schematic = schematic
-        self.symbols = []
+        self.schematic = list(schematic)
+        self.symbols = set()
+        # (parts, gears), kept up to date by edit() once computed
+        self.totals = None
 
+        # Number id -> (value, y, x_start, x_end), x_end exclusive
+        self.numbers = []
+        # (y, x) of every digit -> number id
+        self.num_at = {}
+
+        self.index_numbers()
         self.find_symbols()
 
 
+    def index_numbers(self):
+
+        for yidx, row in enumerate(self.schematic):
+
+            for match in NUMBER_RE.finditer(row):
+
+                num_id = len(self.numbers)
+                self.numbers.append((int(match.group()), yidx, match.start(), match.end()))
+
+                for xidx in range(match.start(), match.end()):
+                    self.num_at[(yidx, xidx)] = num_id
+
+
     def find_symbols(self):
 
         for yidx, row in enumerate(self.schematic):
 
             for xidx, char in enumerate(row):
 
-                if char == '.':
+                if char == '.' or (yidx, xidx) in self.num_at:
                     continue
 
-                try:
-                    int(char)
-                except ValueError:
-                    symloc = (yidx, xidx)
-                else:
-                    continue
+                self.symbols.add((yidx, xidx))
+
 
-                self.symbols.append(symloc)
+    def adjacent_ids(self, y, x):
+        """Gets the ids of the numbers adjacent to coordinates.
+           Each number is listed once, however many of its digits touch
+        """
+
+        num_ids = []
+
+        for yoff, xoff in NEIGHBORS:
+
+            num_id = self.num_at.get((y+yoff, x+xoff))
+
+            if num_id is not None and num_id not in num_ids:
+                num_ids.append(num_id)
+
+        return num_ids
 
 
     def adjacent_parts(self, y, x):
@@ -40,78 +87,132 @@ class Schematic:
         """
         logging.debug('Y,X: %s,%s = %s', y, x, self.schematic[y][x])
 
-        parts = []
+        return [self.numbers[num_id][0] for num_id in self.adjacent_ids(y, x)]
 
-        # Neighbor pixel offsets
-        locs = (
-                (-1, -1), (-1, 0), (-1, 1),
-                ( 0, -1),          ( 0, 1),
-                ( 1, -1), ( 1, 0), ( 1, 1),
-                )
 
-        # Check each neighbor
-        for yoff, xoff in locs:
+    def load_part_num(self, y, x):
+        """Loads a part number at given coordinates.
+           Returns None if coordinates are not an int
+        """
 
-            part_num = self.load_part_num(y+yoff, x+xoff)
+        num_id = self.num_at.get((y, x))
+        if num_id is None:
+            return None
 
-            if part_num is not None and part_num not in parts:
-                parts.append(part_num)
+        return self.numbers[num_id][0]
 
-        return parts
 
+    def is_part(self, num_id):
 
-    def load_part_num(self, y, x):
-        """Loads a part number at given coordinates.
-           Returns None if coordinates are not an int
+        _, y, xstart, xend = self.numbers[num_id]
+
+        return any((yidx, xidx) in self.symbols for yidx in (y-1, y, y+1) for xidx in range(xstart-1, xend+1))
+
+
+    def gear_ratio(self, y, x):
+
+        if (y, x) not in self.symbols or self.schematic[y][x] != '*':
+            return 0
+
+        num_ids = self.adjacent_ids(y, x)
+        if len(num_ids) != 2:
+            return 0
+
+        return self.numbers[num_ids[0]][0] * self.numbers[num_ids[1]][0]
+
+
+    def get_totals(self):
+        """Returns (sum_sym_parts, sum_gear_ratios), computing them only once"""
+
+        if self.totals is None:
+            self.totals = (self.sum_sym_parts(), self.sum_gear_ratios())
+
+        return self.totals
+
+
+    def edit(self, y, x, char):
+        """Sets one cell and updates the totals from get_totals.
+           Only the numbers touching the cell and the gears next to those
+           numbers are re-evaluated, so the cost depends on the number
+           lengths around the cell, not the schematic size.
         """
 
-        try:
-            num = str(int(self.schematic[y][x]))
-        except ValueError:
-            return None
+        if not 0 <= y < len(self.schematic) or not 0 <= x < len(self.schematic[y]):
+            raise IndexError(f'No cell at ({y}, {x})')
+        if len(char) != 1:
+            raise ValueError(f'Expected one character, got {char!r}')
+
+        parts, gears = self.get_totals()
 
-        logging.debug('NUM: %s', num)
+        # Numbers that can merge, split or gain/lose the cell as a symbol
+        old_ids = set(self.adjacent_ids(y, x))
+        if (y, x) in self.num_at:
+            old_ids.add(self.num_at[(y, x)])
 
-        xoff = -1
-        while x + xoff >= 0 and x + xoff < len(self.schematic[y]):
+        # Any gear whose neighbours can change sits next to one of them
+        gear_cells = {(y+yoff, x+xoff) for yoff, xoff in NEIGHBORS} | {(y, x)}
+        for num_id in old_ids:
+            _, numy, xstart, xend = self.numbers[num_id]
+            gear_cells.update((yidx, xidx) for yidx in (numy-1, numy, numy+1) for xidx in range(xstart-1, xend+1))
 
-            try:
-                addleft = str(int(self.schematic[y][x+xoff]))
-                logging.debug('LEFT: %s', addleft)
-            except ValueError:
-                break
-            else:
-                num = addleft + str(num)
+        parts -= sum(self.numbers[num_id][0] for num_id in old_ids if self.is_part(num_id))
+        gears -= sum(self.gear_ratio(*cell) for cell in gear_cells)
 
-            xoff -= 1
+        row = self.schematic[y]
+        self.schematic[y] = row[:x] + char + row[x+1:]
 
-        xoff = 1
-        while x + xoff >= 0 and x + xoff < len(self.schematic[y]):
+        # Re-scan the run of row y covering the old numbers and the cell
+        row_ids = [num_id for num_id in old_ids if self.numbers[num_id][1] == y]
+        lo = min([x] + [self.numbers[num_id][2] for num_id in row_ids])
+        hi = max([x+1] + [self.numbers[num_id][3] for num_id in row_ids])
 
-            try:
-                addright = str(int(self.schematic[y][x+xoff]))
-                logging.debug('RIGHT: %s', addright)
-            except ValueError:
-                break
-            else:
-                num = str(num) + addright
+        for num_id in row_ids:
+            _, _, xstart, xend = self.numbers[num_id]
+            for xidx in range(xstart, xend):
+                del self.num_at[(y, xidx)]
+            self.numbers[num_id] = None
 
-            xoff += 1
+        for match in NUMBER_RE.finditer(self.schematic[y], lo, hi):
+            num_id = len(self.numbers)
+            self.numbers.append((int(match.group()), y, match.start(), match.end()))
+            for xidx in range(match.start(), match.end()):
+                self.num_at[(y, xidx)] = num_id
 
-        return int(num)
+        self.symbols.discard((y, x))
+        if is_symbol(char):
+            self.symbols.add((y, x))
+
+        new_ids = set(self.adjacent_ids(y, x))
+        if (y, x) in self.num_at:
+            new_ids.add(self.num_at[(y, x)])
+
+        parts += sum(self.numbers[num_id][0] for num_id in new_ids if self.is_part(num_id))
+        gears += sum(self.gear_ratio(*cell) for cell in gear_cells)
+
+        self.totals = (parts, gears)
+
+        return self.totals
 
 
     def sum_sym_parts(self):
 
-        total = 0
+        # A number touching several symbols is still one part
+        part_ids = set()
 
         for symy, symx in self.symbols:
+            part_ids.update(self.adjacent_ids(symy, symx))
 
-            parts = self.adjacent_parts(symy, symx)
-            if parts:
-                total += sum(parts)
+        return sum(self.numbers[num_id][0] for num_id in part_ids)
 
-        return total
+
+    def sum_sym_parts_vector(self):
+
+        return vector_sym_parts(self.schematic)
+
+
+    def parallel_totals(self, jobs):
+
+        return parallel_totals(self.schematic, jobs)
 
 
     def sum_gear_ratios(self):
@@ -128,6 +229,153 @@ class Schematic:
         return total
 
 
+def is_symbol(char):
+
+    return char != '.' and not '0' <= char <= '9'
+
+
+def window_row(window, row_spans):
+    """Part and gear contributions of the middle row of a three-row window.
+       Rows outside the schematic are passed as empty strings.
+    """
+
+    above, row, below = window
+    parts = 0
+    gears = 0
+
+    for value, xstart, xend in row_spans[1]:
+
+        lo = max(xstart - 1, 0)
+        if any(is_symbol(char) for line in window for char in line[lo:xend+1]):
+            parts += value
+
+    for xidx, char in enumerate(row):
+
+        if char != '*':
+            continue
+
+        near = [value for spans in row_spans for value, xstart, xend in spans if xstart <= xidx + 1 and xend >= xidx]
+        if len(near) == 2:
+            gears += near[0] * near[1]
+
+    return parts, gears
+
+
+def stream_totals(rows):
+    """Yields (row, parts, gears) for each schematic row as soon as the row
+       below it has been read. Only three rows are held at a time.
+    """
+
+    window = ['', '', '']
+    row_spans = [[], [], []]
+    yidx = -2
+
+    for row in rows:
+
+        row = row.rstrip('\n')
+
+        window = window[1:] + [row]
+        row_spans = row_spans[1:] + [[(int(m.group()), m.start(), m.end()) for m in NUMBER_RE.finditer(row)]]
+        yidx += 1
+
+        if yidx >= 0:
+            yield (yidx,) + window_row(window, row_spans)
+
+    # Flush the final row against an empty one below it
+    if yidx >= -1:
+        window = window[1:] + ['']
+        row_spans = row_spans[1:] + [[]]
+        yield (yidx + 1,) + window_row(window, row_spans)
+
+
+def band_totals(job):
+    """Part and gear totals for rows [lo, hi), given those rows plus one row
+       of overlap on each side. Numbers and gears count in their own row's
+       band only, so neighbouring bands never count the same one twice.
+    """
+
+    rows, offset, lo, hi = job
+
+    parts = 0
+    gears = 0
+
+    for yidx, row_parts, row_gears in stream_totals(rows):
+        if lo <= yidx + offset < hi:
+            parts += row_parts
+            gears += row_gears
+
+    return parts, gears
+
+
+def parallel_totals(rows, jobs):
+    """(sum_sym_parts, sum_gear_ratios) over horizontal bands in a process pool"""
+
+    step = -(-len(rows) // jobs) or 1
+    bands = []
+
+    for lo in range(0, len(rows), step):
+        hi = min(lo + step, len(rows))
+        offset = max(lo - 1, 0)
+        bands.append((rows[offset:hi+1], offset, lo, hi))
+
+    with multiprocessing.Pool(jobs) as pool:
+        partials = pool.map(band_totals, bands)
+
+    return sum(part[0] for part in partials), sum(part[1] for part in partials)
+
+
+def vector_sym_parts(rows):
+    """NumPy version of Schematic.sum_sym_parts.
+       The symbol mask is dilated to its 8-neighbourhood, and digit runs
+       with any cell under the dilated mask are summed as part numbers.
+    """
+
+    if np is None:
+        raise Exception('NumPy is required for the vectorized engine')
+
+    height = len(rows)
+    width = max((len(row) for row in rows), default=0)
+
+    # One spare '.' column keeps runs from wrapping onto the next row
+    grid = np.full((height, width + 1), ord('.'), dtype=np.uint8)
+    for yidx, row in enumerate(rows):
+        grid[yidx, :len(row)] = np.frombuffer(row.encode(), dtype=np.uint8)
+
+    digit = (grid >= 48) & (grid <= 57)
+    symbol = ~digit & (grid != ord('.'))
+
+    padded = np.pad(symbol, 1)
+    near = np.zeros_like(symbol)
+    for yoff, xoff in NEIGHBORS:
+        near |= padded[1+yoff:1+yoff+height, 1+xoff:1+xoff+width+1]
+
+    flat_digit = digit.ravel()
+    flat_near = near.ravel()
+    values = grid.ravel().astype(np.int64) - 48
+
+    # Run bounds come from the digit mask edges, [start, end)
+    edges = np.diff(np.concatenate(([0], flat_digit.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    # Numbers over 18 digits do not fit in int64
+    if len(starts) and (ends - starts).max() > 18:
+        logging.warning('NUMPY: numbers over 18 digits, using sum_sym_parts')
+        return Schematic(rows).sum_sym_parts()
+
+    cells = np.flatnonzero(flat_digit)
+    run_of = np.cumsum(edges[:-1] == 1)[cells] - 1
+
+    numbers = np.zeros(len(starts), dtype=np.int64)
+    np.add.at(numbers, run_of, values[cells] * 10 ** (ends[run_of] - 1 - cells))
+
+    touched = np.zeros(len(starts), dtype=bool)
+    touched[run_of[flat_near[cells]]] = True
+
+    # Summed as Python ints, as many large parts can still overflow int64
+    return sum(numbers[touched].tolist())
+
+
 def parse_args():
 
     parser = argparse.ArgumentParser(description='2023 Advent of Code, Day 3', epilog='https://adventofcode.com')
@@ -136,6 +384,9 @@ def parse_args():
     parser.add_argument('-p1', '--part-1', dest='p1', action='store_true', default=False, help='Only run part 1')
     parser.add_argument('-p2', '--part-2', dest='p2', action='store_true', default=False, help='Only run part 2, overrides -p1')
     parser.add_argument('-l', '--log', dest='logfile', action='store', help='Filename for writing log file')
+    parser.add_argument('-s', '--stream', dest='stream', action='store_true', default=False, help='Stream rows, keeping a three-row window')
+    parser.add_argument('-j', '--jobs', dest='jobs', action='store', type=int, default=1, help='Number of worker processes, each taking a band of rows')
+    parser.add_argument('-n', '--numpy', dest='numpy', action='store_true', default=False, help='Use the NumPy engine for part 1')
 
     parsed = parser.parse_args()
 
@@ -154,24 +405,52 @@ if __name__ == '__main__':
         fn.insert(1, 'test')
     datafile = '.'.join(fn)
 
+    ##
+    # Both parts, one row at a time
+    if conf.stream:
+        start = time.time()
+        parts_sum = 0
+        gr_sum = 0
+        with open(datafile, 'r') as f:
+            for yidx, parts, gears in stream_totals(f):
+                parts_sum += parts
+                gr_sum += gears
+        end = time.time()
+        logging.info('[Part 1] Solution: %s in %s seconds', parts_sum, round(end - start, 4))
+        logging.info('[Part 2] Solution: %s in %s seconds', gr_sum, round(end - start, 4))
+
+    else:
+        with open(datafile, 'r') as f:
+            data_in = f.read().strip()
 
-    with open(datafile, 'r') as f:
-        data_in = f.read().strip()
+        schem_data = data_in.split('\n')
+
+    ##
+    # Both parts, one band of rows per process
+    if conf.jobs > 1 and not conf.stream:
+        start = time.time()
+        parts_sum, gr_sum = parallel_totals(schem_data, conf.jobs)
+        end = time.time()
+        logging.info('[Part 1] Solution: %s in %s seconds', parts_sum, round(end - start, 4))
+        logging.info('[Part 2] Solution: %s in %s seconds', gr_sum, round(end - start, 4))
 
-    schem_data = data_in.split('\n')
-    schematic = Schematic(schem_data)
+    elif not conf.stream:
+        schematic = Schematic(schem_data)
 
     ##
     # Part 1
-    if not conf.p2:
+    if not conf.p2 and not conf.stream and conf.jobs < 2:
         start = time.time()
-        parts_sum = schematic.sum_sym_parts()
+        if conf.numpy:
+            parts_sum = schematic.sum_sym_parts_vector()
+        else:
+            parts_sum = schematic.sum_sym_parts()
         end = time.time()
         logging.info('[Part 1] Solution: %s in %s seconds', parts_sum, round(end - start, 4))
 
     ##
     # Part 2
-    if not conf.p1 or conf.p2:
+    if (not conf.p1 or conf.p2) and not conf.stream and conf.jobs < 2:
         start = time.time()
         gr_sum = schematic.sum_gear_ratios()
         end = time.time()
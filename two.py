@@ -1,121 +1,290 @@
+import re
+import json
 import time
 import logging
 import argparse
 
+from array import array
+from bisect import bisect_right
 from pathlib import Path
 
 
-def parse_game(game_str):
+COLORS = ('red', 'green', 'blue')
 
-    logging.debug('GAMESTR: %s', game_str)
 
-    gdata = {}
+TOKEN_RE = re.compile(r'Game (\d+)|(\d+) (red|green|blue)')
 
-    parts = game_str.split(': ')
-    gid = int(parts[0].split()[1])
 
-    gdata.setdefault(gid, [])
+def tokenize_games(text):
+    """Yields (game_id, color, count) for every color count in the text,
+       in one regex pass. The text may hold any number of whole game lines.
+    """
 
-    pulls = parts[1].split('; ')
+    gid = None
 
-    for pull in pulls:
-        color_counts = pull.split(', ')
-        pdata = {}
-        for count in color_counts:
-            praw = count.split()
-            amt = int(praw[0])
-            color = praw[1]
-            pdata[color] = amt
-        gdata[gid].append(pdata)
+    for match in TOKEN_RE.finditer(text):
 
-    return gdata
+        game, count, color = match.groups()
 
+        if game is not None:
+            gid = int(game)
+            continue
 
-def sum_possible(games, red=None, green=None, blue=None):
+        yield gid, color, int(count)
 
-    psum = 0
 
-    for gid, gdata in games.items():
-        logging.debug('Game: %s', gid)
+def stream_tokens(fh):
+    """Tokenizes games from a file handle, one buffered line at a time"""
+
+    for line in fh:
+        yield from tokenize_games(line)
+
+
+def fold_games(tokens):
+    """Folds game tokens into a columnar game store: parallel int arrays of
+       game id and the per-game maximum of each color, keyed 'id', 'red',
+       'green', 'blue'. Tokens for a game must be contiguous.
+    """
+
+    games = {key: array('q') for key in ('id',) + COLORS}
+    cols = [games[color] for color in COLORS]
+
+    gid = None
+
+    for tok_gid, color, count in tokens:
+
+        if tok_gid != gid:
+            gid = tok_gid
+            games['id'].append(gid)
+            for col in cols:
+                col.append(0)
+
+        col = games[color]
+        if count > col[-1]:
+            col[-1] = count
+
+    return games
+
+
+def parse_game(game_str):
+    """Parses one game line into (game_id, max_red, max_green, max_blue)"""
+
+    logging.debug('GAMESTR: %s', game_str)
+
+    games = fold_games(tokenize_games(game_str))
 
-        possible = True
+    return tuple(games[key][0] for key in games)
 
-        for pull in gdata:
 
-            logging.debug('PULL: %s', pull)
+def parse_games(data_in):
 
-            if red is not None and pull.setdefault('red', 0) > red:
-                possible = False
-                break
+    return fold_games(tokenize_games(data_in))
 
-            if green is not None and pull.setdefault('green', 0) > green:
-                possible = False
-                break
 
-            if blue is not None and pull.setdefault('blue', 0) > blue:
-                possible = False
-                break
+def sum_possible(games, red=None, green=None, blue=None):
+
+    limits = [(games[color], limit) for color, limit in zip(COLORS, (red, green, blue)) if limit is not None]
+
+    psum = 0
+
+    for idx, gid in enumerate(games['id']):
 
-        if possible:
+        if all(col[idx] <= limit for col, limit in limits):
             logging.debug('PSUM ADDING: %s', gid)
             psum += gid
 
     return psum
 
 
-def sum_min_power(games):
+class BagIndex:
+    """Answers sum_possible for any bag limits from game maxima indexed once.
 
-    gp_sum = 0
+       Games with the same (red, green, blue) maxima are merged, and the
+       merged points are sorted by red. A Fenwick tree over that order has,
+       in each node, a Fenwick tree over the node's green values whose nodes
+       keep their blue values sorted with running id sums. A query walks
+       both trees and bisects blue, so it is O(log^3 points) with nothing
+       rebuilt, and memory is O(points * log^2 points).
+    """
 
-    for gid, gdata in games.items():
+    def __init__(self, games):
 
-        logging.debug('Game: %s', gid)
+        merged = {}
+        for gid, *maxes in zip(games['id'], games['red'], games['green'], games['blue']):
+            merged[tuple(maxes)] = merged.get(tuple(maxes), 0) + gid
 
-        rmin = None
-        gmin = None
-        bmin = None
+        points = sorted((red, green, blue, ids) for (red, green, blue), ids in merged.items())
+        self.reds = [point[0] for point in points]
 
-        for pull in gdata:
+        # Fenwick node i covers points[i - lowbit(i):i]
+        self.nodes = [None]
+        for idx in range(1, len(points) + 1):
+            self.nodes.append(build_green_tree(points[idx - (idx & -idx):idx]))
 
-            logging.debug('Pull: %s', pull)
 
-            rpull = pull.setdefault('red', -1)
-            if rpull > 0 and (rmin is None or rpull > rmin):
-                rmin = rpull
+    def query(self, red=None, green=None, blue=None):
 
-            gpull = pull.setdefault('green', -1)
-            if gpull > 0 and (gmin is None or gpull > gmin):
-                gmin = gpull
+        total = 0
+        idx = len(self.reds) if red is None else bisect_right(self.reds, red)
 
-            bpull = pull.setdefault('blue', -1)
-            if bpull > 0 and (bmin is None or bpull > bmin):
-                bmin = bpull
+        while idx > 0:
 
-        mult = []
-        if rmin is not None:
-            mult.append(rmin)
-        if gmin is not None:
-            mult.append(gmin)
-        if bmin is not None:
-            mult.append(bmin)
+            greens, blues, sums = self.nodes[idx]
 
-        logging.debug('Mult: %s', mult)
+            gidx = len(greens) if green is None else bisect_right(greens, green)
+            while gidx > 0:
+                bidx = len(blues[gidx]) if blue is None else bisect_right(blues[gidx], blue)
+                total += sums[gidx][bidx]
+                gidx -= gidx & -gidx
 
-        if not mult:
-            continue
+            idx -= idx & -idx
+
+        return total
+
+
+    def query_many(self, bags):
+        """Answers a batch of (red, green, blue) limits, in order"""
+
+        return [self.query(*bag) for bag in bags]
+
+
+def build_green_tree(points):
+    """Static (green, blue) dominance sums for BagIndex.
+       Returns (greens, blues, sums): the sorted distinct greens, and per
+       Fenwick node over them, its sorted blues and running id sums.
+    """
+
+    greens = sorted({green for _, green, _, _ in points})
+    members = [[] for _ in range(len(greens) + 1)]
+
+    for _, green, blue, ids in points:
+        gidx = bisect_right(greens, green)
+        while gidx <= len(greens):
+            members[gidx].append((blue, ids))
+            gidx += gidx & -gidx
+
+    blues = []
+    sums = []
+    for node in members:
+        node.sort()
+        blues.append(array('q', (blue for blue, _ in node)))
+        running = array('q', [0])
+        for _, ids in node:
+            running.append(running[-1] + ids)
+        sums.append(running)
+
+    return greens, blues, sums
+
+
+def game_power(rmax, gmax, bmax):
 
-        mult_total = 1
-        for m in mult:
-            mult_total = mult_total * m
+    # Colors never pulled are left out of the product, rather than zeroing it
+    if rmax or gmax or bmax:
+        return (rmax or 1) * (gmax or 1) * (bmax or 1)
 
-        logging.debug('MT: %s', mult_total)
+    return 0
 
-        gp_sum += mult_total
+
+def sum_min_power(games):
+
+    gp_sum = 0
+
+    for rmax, gmax, bmax in zip(games['red'], games['green'], games['blue']):
+        gp_sum += game_power(rmax, gmax, bmax)
 
     logging.debug('GP_SUM: %s', gp_sum)
     return gp_sum
 
 
+class GameLog:
+    """Keeps running sum_possible and sum_min_power totals as games arrive.
+
+       Each added line is folded on its own, so an update costs only the
+       pulls in that game. add_log remembers how far into the log file it
+       has read, so a log that has grown is only read from where it left off.
+    """
+
+    def __init__(self, red=None, green=None, blue=None):
+
+        self.limits = [red, green, blue]
+        self.games = 0
+        self.psum = 0
+        self.power = 0
+        # Bytes of the log file already counted
+        self.offset = 0
+
+
+    def add_game(self, game_str):
+
+        gid, *maxes = parse_game(game_str)
+
+        if all(limit is None or cmax <= limit for cmax, limit in zip(maxes, self.limits)):
+            self.psum += gid
+
+        self.power += game_power(*maxes)
+        self.games += 1
+
+
+    def add_log(self, filename):
+        """Adds the games appended to a log file since the last call.
+           A final line with no newline yet is left for the next call.
+           Returns how many games were added.
+        """
+
+        added = 0
+
+        with open(filename, 'rb') as f:
+
+            f.seek(0, 2)
+            if f.tell() < self.offset:
+                raise Exception(f'{filename} is shorter than the {self.offset} bytes already counted')
+
+            f.seek(self.offset)
+
+            for line in f:
+
+                if not line.endswith(b'\n'):
+                    logging.info('STATE: leaving unfinished line for the next run: %s', line)
+                    break
+
+                self.offset += len(line)
+
+                if line.strip():
+                    self.add_game(line.decode())
+                    added += 1
+
+        return added
+
+
+    def save(self, filename):
+
+        state = {
+                'limits': self.limits,
+                'games': self.games,
+                'psum': self.psum,
+                'power': self.power,
+                'offset': self.offset,
+                }
+
+        with open(filename, 'w') as f:
+            json.dump(state, f)
+
+
+    @classmethod
+    def load(cls, filename):
+
+        with open(filename, 'r') as f:
+            state = json.load(f)
+
+        game_log = cls(*state['limits'])
+        game_log.games = state['games']
+        game_log.psum = state['psum']
+        game_log.power = state['power']
+        game_log.offset = state['offset']
+
+        return game_log
+
+
 def parse_args():
 
     parser = argparse.ArgumentParser(description='2023 Advent of Code, Day 2', epilog='https://adventofcode.com')
@@ -124,6 +293,8 @@ def parse_args():
     parser.add_argument('-p1', '--part-1', dest='p1', action='store_true', default=False, help='Only run part 1')
     parser.add_argument('-p2', '--part-2', dest='p2', action='store_true', default=False, help='Only run part 2, overrides -p1')
     parser.add_argument('-l', '--log', dest='logfile', action='store', help='Filename for writing log file')
+    parser.add_argument('-s', '--state', dest='statefile', action='store', help='Add input games to running totals saved in this file')
+    parser.add_argument('-b', '--bag', dest='bags', action='append', nargs=3, type=int, metavar=('RED', 'GREEN', 'BLUE'), help='Bag limits for part 1, may be repeated')
 
     parsed = parser.parse_args()
 
@@ -142,25 +313,41 @@ if __name__ == '__main__':
         fn.insert(1, 'test')
     datafile = '.'.join(fn)
 
-    with open(datafile, 'r') as f:
-        data_in = f.read().strip()
-
-    games_raw = data_in.split('\n')
-    games = {}
-    for game_str in games_raw:
-        games.update(parse_game(game_str))
+    ##
+    # Running totals, picking up from the saved state
+    if conf.statefile:
+        start = time.time()
+        if conf.bags and len(conf.bags) > 1:
+            raise Exception('--state keeps totals for a single --bag')
+        if Path(conf.statefile).exists():
+            game_log = GameLog.load(conf.statefile)
+            if conf.bags and list(conf.bags[0]) != game_log.limits:
+                raise Exception(f'{conf.statefile} was saved with bag {game_log.limits}, not {conf.bags[0]}')
+        else:
+            game_log = GameLog(*(conf.bags or [(12, 13, 14)])[0])
+        added = game_log.add_log(datafile)
+        game_log.save(conf.statefile)
+        logging.info('STATE: %s new games added to %s', added, conf.statefile)
+        end = time.time()
+        logging.info('[Part 1] Solution: %s in %s seconds (%s games)', game_log.psum, round(end - start, 4), game_log.games)
+        logging.info('[Part 2] Solution: %s in %s seconds (%s games)', game_log.power, round(end - start, 4), game_log.games)
+    else:
+        with open(datafile, 'r') as f:
+            games = fold_games(stream_tokens(f))
 
     ##
     # Part 1
-    if not conf.p2:
+    if not conf.p2 and not conf.statefile:
         start = time.time()
-        psummed = sum_possible(games, red=12, green=13, blue=14)
+        bags = conf.bags or [(12, 13, 14)]
+        psummed = BagIndex(games).query_many(bags)
         end = time.time()
-        logging.info('[Part 1] Solution: %s in %s seconds', psummed, round(end - start, 4))
+        for bag, psum in zip(bags, psummed):
+            logging.info('[Part 1] Solution: %s in %s seconds (bag %s)', psum, round(end - start, 4), tuple(bag))
 
     ##
     # Part 2
-    if not conf.p1 or conf.p2:
+    if (not conf.p1 or conf.p2) and not conf.statefile:
         start = time.time()
         mps = sum_min_power(games)
         end = time.time()